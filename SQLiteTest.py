@@ -3,10 +3,73 @@ import time
 import random
 from datetime import datetime
 import logging
+import logging.handlers
+import queue
 import os
 import hashlib
 import argparse
-from maintenance import realizar_mantenimiento_power_on
+import atexit
+import itertools
+import multiprocessing
+import xxhash
+from maintenance import realizar_mantenimiento_power_on, sentencia_insert_multiple, MAX_PARAMETROS_SQL
+
+# Tabla de traducción de cualquier byte a una letra minúscula (a-z)
+ALPHA_MAP = bytes(0x61 + b % 26 for b in range(256))
+
+def calculate_hash(data):
+    """!
+    @brief Calcula un hash XXH3-128 consistente para los datos
+    @details El checksum solo se usa para detectar corrupción, por lo que se emplea
+             un hash no criptográfico mucho más rápido que MD5.
+    @return Digest binario de 16 bytes, o None si no hay datos (valor NULL)
+    """
+    if data is None:
+        return None
+    return xxhash.xxh3_128_digest(data if isinstance(data, bytes) else data.encode('utf-8'))
+
+def format_digest(digest):
+    """!
+    @brief Representa un checksum para el log
+    @return Texto hexadecimal si el checksum es binario; en otro caso, el valor tal cual
+    """
+    return digest.hex() if isinstance(digest, bytes) else digest
+
+def generate_payloads(count, size=1000):
+    """!
+    @brief Genera un bloque de datos aleatorios con sus checksums
+    @details Todos los datos del bloque se obtienen con una única llamada a os.urandom
+             y una única traducción a letras, y después se trocean.
+    @param count Número de datos a generar
+    @param size Tamaño de cada dato en bytes
+    @return Lista de tuplas (datos, checksum)
+    """
+    buffer = os.urandom(count * size).translate(ALPHA_MAP)
+    return [(data, calculate_hash(data))
+            for data in (buffer[start:start + size] for start in range(0, count * size, size))]
+
+def verify_id_range(db_path, first_id, last_id):
+    """!
+    @brief Verifica los checksums de los registros de test_data en un rango de ids
+    @details Se ejecuta en un proceso independiente con su propia conexión de solo lectura.
+    @param db_path Ruta de la base de datos
+    @param first_id Primer id del rango (incluido)
+    @param last_id Último id del rango (incluido)
+    @return Tupla (registros verificados, registros corruptos)
+    """
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        conn.execute("PRAGMA query_only=1")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute("PRAGMA mmap_size=268435456")
+        conn.create_function("calculate_hash", 1, calculate_hash, deterministic=True)
+        return conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(calculate_hash(value) IS NOT checksum), 0) "
+            "FROM test_data WHERE id BETWEEN ? AND ?",
+            (first_id, last_id)
+        ).fetchone()
+    finally:
+        conn.close()
 
 class SQLiteStressTest:
     """!
@@ -15,17 +78,52 @@ class SQLiteStressTest:
              de una base de datos SQLite, manteniendo los datos entre ejecuciones.
     """
 
-    def __init__(self, base_path, pause_time=10, progress_interval=10):
+    # Columnas que se rellenan al insertar un registro y máximo de filas por INSERT
+    _INSERT_COLUMNS = ('timestamp', 'value', 'checksum')
+    _MAX_ROWS_PER_INSERT = MAX_PARAMETROS_SQL // len(_INSERT_COLUMNS)
+    
+    # A partir de este número de registros la verificación completa se reparte entre procesos
+    _PARALLEL_VERIFY_MIN_ROWS = 200000
+    
+    # Número máximo de intentos para escribir un lote
+    _WRITE_ATTEMPTS = 3
+    
+    # Códigos primarios SQLITE_BUSY y SQLITE_LOCKED, con los que se reintenta la escritura
+    # (el módulo sqlite3 solo expone las constantes desde Python 3.11)
+    _BUSY_ERROR_CODES = (5, 6)
+    
+    # Fechas del primer y último registro; solo cuentan las marcas de tiempo numéricas,
+    # ya que SQLite ordena cualquier texto por encima de los números
+    _DATE_RANGE_COLUMNS = ("MIN(timestamp) FILTER (WHERE typeof(timestamp) IN ('integer', 'real')), "
+                           "MAX(timestamp) FILTER (WHERE typeof(timestamp) IN ('integer', 'real'))")
+    
+    # Registros leídos y actualizados en cada transacción de una migración
+    _MIGRATION_CHUNK_ROWS = 10000
+
+    def __init__(self, base_path, pause_time=10, progress_interval=10, batch_size=100):
         """!
         @brief Constructor de la clase SQLiteStressTest
         @param base_path Ruta base donde se encuentran los archivos de prueba
         @param pause_time Tiempo de pausa entre operaciones en segundos
         @param progress_interval Intervalo de actualización del progreso en segundos
+        @param batch_size Número máximo de registros que se escriben en cada transacción.
+                          El lote se escribe antes si su registro más antiguo supera la
+                          pausa entre operaciones (mínimo 1 segundo), para no perder datos
+                          ya generados si el proceso se interrumpe.
         """
         self.db_path = 'stress_test.db'
         self.log_path = 'sqlite_test.log'
         self.pause_time = pause_time
         self.progress_interval = progress_interval
+        self.batch_size = max(1, batch_size)
+        self.max_batch_age = max(pause_time, 1)
+        self._pending = []
+        self.conn_w = None
+        self.cursor = None
+        self.conn_r = None
+        self.cursor_r = None
+        self.page_size = None
+        self.log_listener = None
         
         # Crear el archivo de log vacío si no existe
         if not os.path.exists(self.log_path):
@@ -39,7 +137,7 @@ class SQLiteStressTest:
         logging.info("Nueva sesión iniciada")
         
         # Realizar mantenimiento de power on
-        if not realizar_mantenimiento_power_on():
+        if not realizar_mantenimiento_power_on(self.db_path):
             logging.error("Error en el mantenimiento de power on. La aplicación puede no funcionar correctamente.")
             raise Exception("Error en el mantenimiento de power on")
         
@@ -53,49 +151,291 @@ class SQLiteStressTest:
     def setup_logging(self):
         """!
         @brief Configura el sistema de logging
+        @details Los registros se encolan y un hilo en segundo plano los escribe en el
+                 fichero, de modo que el bucle de prueba no espera a la escritura en disco.
+                 Ese hilo vacía el fichero tras cada registro para que el final del log no
+                 se pierda si el proceso termina de forma abrupta.
         """
         try:
             # Asegurarse de que el archivo de log se puede crear
+            file_handler = logging.FileHandler(self.log_path)
+            log_queue = queue.Queue(-1)
+            self.log_listener = logging.handlers.QueueListener(log_queue, file_handler)
+            self.log_listener.start()
+            atexit.register(self.stop_logging)
+            
+            # El QueueHandler formatea cada registro antes de encolarlo
             logging.basicConfig(
-                filename=self.log_path,
                 level=logging.INFO,
                 format='%(asctime)s - %(levelname)s - %(message)s',
+                handlers=[logging.handlers.QueueHandler(log_queue)],
                 force=True  # Forzar la configuración del logging
             )
             print(f"Archivo de log creado en: {self.log_path}")
         except Exception as e:
             print(f"Error al configurar el logging: {e}")
+
+    def stop_logging(self):
+        """!
+        @brief Escribe los registros pendientes y cierra el fichero de log
+        """
+        if self.log_listener is None:
+            return
+        self.log_listener.stop()
+        for handler in self.log_listener.handlers:
+            handler.close()
+        self.log_listener = None
             
     def setup_database(self):
         """!
         @brief Inicializa la estructura de la base de datos si no existe
+        @details Abre dos conexiones persistentes que se reutilizan durante toda la prueba:
+                 una de escritura, configurada en modo WAL con sincronización NORMAL, y
+                 otra de solo lectura para las verificaciones, que trabaja sobre su propia
+                 instantánea del WAL sin compartir el estado de las transacciones de
+                 escritura. Ambas mapean el fichero en memoria (hasta 256 MB).
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS test_data (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        timestamp DATETIME,
-                        value TEXT,
-                        checksum TEXT
-                    )
-                ''')
-                conn.commit()
-                
-                # Obtener el número actual de registros
-                cursor.execute("SELECT COUNT(*) FROM test_data")
-                count = cursor.fetchone()[0]
-                logging.info(f"Registros existentes en la base de datos: {count}")
+            self.conn_w = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False,
+                                          cached_statements=256)
+            
+            # El mantenimiento de power on ya ha creado el fichero con páginas de 8 KB,
+            # más adecuadas para registros de 1 KB, y en modo WAL
+            self.conn_w.execute("PRAGMA journal_mode=WAL")
+            self.conn_w.execute("PRAGMA synchronous=NORMAL")
+            self.conn_w.execute("PRAGMA busy_timeout=5000")
+            self.conn_w.execute("PRAGMA temp_store=MEMORY")
+            self.conn_w.execute("PRAGMA cache_size=-64000")
+            self.conn_w.execute("PRAGMA mmap_size=268435456")
+            self.conn_w.execute("PRAGMA cache_spill=OFF")
+            self.conn_w.execute("PRAGMA journal_size_limit=67108864")
+            self.page_size = self.conn_w.execute("PRAGMA page_size").fetchone()[0]
+            self.cursor = self.conn_w.cursor()
+            atexit.register(self.close_database)
+            
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS test_data (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp DATETIME,
+                    value BLOB,
+                    checksum BLOB
+                )
+            ''')
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_test_id_cksum ON test_data(id, checksum)")
+            self.migrate_database()
+            
+            self.conn_r = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, isolation_level=None,
+                                          check_same_thread=False)
+            self.conn_r.execute("PRAGMA query_only=1")
+            self.conn_r.execute("PRAGMA busy_timeout=5000")
+            self.conn_r.execute("PRAGMA temp_store=MEMORY")
+            self.conn_r.execute("PRAGMA cache_size=-64000")
+            self.conn_r.execute("PRAGMA mmap_size=268435456")
+            self.conn_r.create_function("calculate_hash", 1, calculate_hash, deterministic=True)
+            self.cursor_r = self.conn_r.cursor()
+            
+            # Obtener el número actual de registros
+            self.cursor_r.execute("SELECT COUNT(*) FROM test_data")
+            count = self.cursor_r.fetchone()[0]
+            logging.info(f"Registros existentes en la base de datos: {count}")
                 
         except sqlite3.Error as e:
             logging.error(f"Error al acceder a la base de datos: {e}")
 
+    def migrate_database(self):
+        """!
+        @brief Actualiza los datos almacenados al formato actual
+        @details La versión del formato se guarda en PRAGMA user_version.
+                 Los registros se migran por bloques de ids, cada uno en su propia
+                 transacción, para no cargar toda la tabla en memoria. Cada paso puede
+                 repetirse sin efecto sobre los registros ya migrados, de modo que una
+                 migración interrumpida continúa en el siguiente arranque.
+                 Versión 1: los checksums pasan de MD5 a XXH3-128. Solo se recalculan
+                 los registros cuyo MD5 es correcto, de modo que los registros
+                 corruptos se siguen detectando como tales.
+                 Versión 2: las marcas de tiempo ISO (hora local) pasan a segundos
+                 desde epoch almacenados como REAL. Las que no se pueden interpretar se
+                 dejan como texto y se excluyen de las fechas del reporte.
+                 Versión 3: los valores de texto pasan a BLOB, igual que los que escribe
+                 la prueba, para no validar ni recodificar UTF-8 al leerlos.
+                 Versión 4: los checksums hexadecimales pasan a digest binario de
+                 16 bytes (BLOB), la mitad de espacio. Los que no son hexadecimales se
+                 guardan con sus bytes originales, de modo que el registro se sigue
+                 detectando como corrupto.
+        """
+        version = self.cursor.execute("PRAGMA user_version").fetchone()[0]
+        
+        if version < 1:
+            md5 = hashlib.md5
+            xxh = xxhash.xxh3_128_hexdigest
+            migrated = self.migrate_rows(
+                "SELECT id, CAST(value AS BLOB), checksum FROM test_data WHERE id > ? ORDER BY id LIMIT ?",
+                lambda row_id, value, stored_checksum:
+                    (xxh(value), row_id)
+                    if value is not None and md5(value).hexdigest() == stored_checksum else None,
+                "UPDATE test_data SET checksum = ? WHERE id = ?"
+            )
+            self.cursor.execute("PRAGMA user_version = 1")
+            logging.info(f"Checksums migrados de MD5 a XXH3: {migrated} registros")
+        
+        if version < 2:
+            invalid = []
+            
+            def to_epoch(row_id, timestamp):
+                try:
+                    return datetime.fromisoformat(timestamp).timestamp(), row_id
+                except ValueError:
+                    invalid.append(row_id)
+                    return None
+            
+            migrated = self.migrate_rows(
+                "SELECT id, timestamp FROM test_data WHERE typeof(timestamp) = 'text' AND id > ? "
+                "ORDER BY id LIMIT ?",
+                to_epoch,
+                "UPDATE test_data SET timestamp = ? WHERE id = ?"
+            )
+            self.cursor.execute("PRAGMA user_version = 2")
+            logging.info(f"Marcas de tiempo migradas a epoch: {migrated} registros")
+            if invalid:
+                logging.warning(f"Marcas de tiempo no válidas conservadas como texto: {len(invalid)} "
+                                f"registros (primer id: {invalid[0]})")
+        
+        if version < 3:
+            self.conn_w.execute("BEGIN")
+            self.cursor.execute("UPDATE test_data SET value = CAST(value AS BLOB) WHERE typeof(value) = 'text'")
+            migrated = self.cursor.rowcount
+            self.cursor.execute("PRAGMA user_version = 3")
+            self.conn_w.commit()
+            logging.info(f"Valores migrados a BLOB: {migrated} registros")
+        
+        if version < 4:
+            invalid = []
+            
+            def to_digest(row_id, checksum):
+                try:
+                    return bytes.fromhex(checksum.decode('ascii')), row_id
+                except ValueError:
+                    invalid.append(row_id)
+                    return checksum, row_id
+            
+            migrated = self.migrate_rows(
+                "SELECT id, CAST(checksum AS BLOB) FROM test_data WHERE typeof(checksum) = 'text' AND id > ? "
+                "ORDER BY id LIMIT ?",
+                to_digest,
+                "UPDATE test_data SET checksum = ? WHERE id = ?"
+            )
+            self.cursor.execute("PRAGMA user_version = 4")
+            logging.info(f"Checksums migrados a digest binario: {migrated - len(invalid)} registros")
+            if invalid:
+                logging.warning(f"Checksums no hexadecimales conservados como corruptos: {len(invalid)} "
+                                f"registros (primer id: {invalid[0]})")
+
+    def migrate_rows(self, query, convert, update):
+        """!
+        @brief Actualiza por bloques de ids los registros devueltos por una consulta
+        @param query Consulta cuyo primer campo es el id, con parámetros para el último id
+                     procesado y el tamaño del bloque
+        @param convert Función que recibe los campos de una fila y devuelve los parámetros
+                       del UPDATE, o None si la fila no debe modificarse
+        @param update Sentencia UPDATE que se ejecuta para cada fila convertida
+        @return Número de registros actualizados
+        """
+        last_id = 0
+        migrated = 0
+        while True:
+            rows = self.cursor.execute(query, (last_id, self._MIGRATION_CHUNK_ROWS)).fetchall()
+            if not rows:
+                return migrated
+            last_id = rows[-1][0]
+            updates = [params for params in itertools.starmap(convert, rows) if params is not None]
+            self.conn_w.execute("BEGIN")
+            self.cursor.executemany(update, updates)
+            self.conn_w.commit()
+            migrated += len(updates)
+
+    def close_database(self):
+        """!
+        @brief Realiza un checkpoint del WAL y cierra las conexiones persistentes
+        """
+        if self.conn_r is not None:
+            self.conn_r.close()
+            self.conn_r = None
+            self.cursor_r = None
+        if self.conn_w is None:
+            return
+        try:
+            self.conn_w.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.conn_w.close()
+        except sqlite3.Error as e:
+            logging.error(f"Error al cerrar la base de datos: {e}")
+        self.conn_w = None
+        self.cursor = None
+
     def calculate_hash(self, data):
         """!
-        @brief Calcula un hash MD5 consistente para los datos
+        @brief Calcula un hash XXH3-128 consistente para los datos
+        """
+        return calculate_hash(data)
+
+    def flush_pending(self):
+        """!
+        @brief Escribe en una única transacción los registros pendientes
+        @details Los registros se insertan con sentencias INSERT de varias filas dentro de
+                 una transacción BEGIN IMMEDIATE, que obtiene el bloqueo de escritura antes
+                 de empezar. Si la base de datos está ocupada o bloqueada se reintenta con
+                 espera exponencial. Si la escritura falla definitivamente los registros
+                 del lote se descartan, para que un error persistente (por ejemplo, disco
+                 lleno) no haga crecer el lote sin límite, y se propaga la excepción. Si
+                 la escritura se interrumpe con Ctrl+C los registros se conservan para que
+                 se escriban al terminar la prueba.
+        """
+        if not self._pending:
+            return
+        try:
+            for attempt in range(self._WRITE_ATTEMPTS):
+                try:
+                    self.write_pending()
+                    break
+                except sqlite3.OperationalError as e:
+                    code = getattr(e, 'sqlite_errorcode', 0) & 0xff
+                    if code not in self._BUSY_ERROR_CODES or attempt == self._WRITE_ATTEMPTS - 1:
+                        raise
+                    logging.warning(f"Escritura del lote fallida (intento {attempt + 1}): {e}")
+                    time.sleep(0.05 * 2 ** attempt)
+        except sqlite3.Error:
+            logging.error(f"Lote descartado: {len(self._pending)} registros no escritos")
+            self._pending.clear()
+            raise
+        self._pending.clear()
+
+    def write_pending(self):
+        """!
+        @brief Inserta los registros pendientes en una transacción BEGIN IMMEDIATE
+        """
+        self.conn_w.execute("BEGIN IMMEDIATE")
+        try:
+            for start in range(0, len(self._pending), self._MAX_ROWS_PER_INSERT):
+                rows = self._pending[start:start + self._MAX_ROWS_PER_INSERT]
+                self.cursor.execute(sentencia_insert_multiple('test_data', self._INSERT_COLUMNS, len(rows)),
+                                    list(itertools.chain.from_iterable(rows)))
+            self.conn_w.commit()
+        except BaseException:
+            self.conn_w.rollback()
+            raise
+
+    def database_size(self):
+        """!
+        @brief Calcula el tamaño lógico de la base de datos en bytes
+        @details Usa el número de páginas que conoce la conexión, incluidas las que aún
+                 están en el WAL, sin consultar el sistema de ficheros.
+        """
+        return self.conn_w.execute("PRAGMA page_count").fetchone()[0] * self.page_size
+
+    def format_timestamp(self, timestamp):
+        """!
+        @brief Convierte una marca de tiempo en segundos desde epoch a texto ISO en hora local
         """
-        return hashlib.md5(data.encode('utf-8')).hexdigest()
+        return datetime.fromtimestamp(timestamp).isoformat() if timestamp is not None else None
 
     def get_database_stats(self):
         """!
@@ -104,46 +444,54 @@ class SQLiteStressTest:
         """
         stats = {}
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # Obtener número total de registros
-                cursor.execute("SELECT COUNT(*) FROM test_data")
-                stats['total_records'] = cursor.fetchone()[0]
-                
-                # Obtener fecha del primer y último registro
-                cursor.execute("SELECT MIN(timestamp), MAX(timestamp) FROM test_data")
-                first_date, last_date = cursor.fetchone()
-                stats['first_record'] = first_date
-                stats['last_record'] = last_date
-                
-                # Obtener tamaño de la base de datos
-                stats['db_size'] = os.path.getsize(self.db_path)
-                
-                # Verificar integridad
-                cursor.execute("SELECT value, checksum FROM test_data")
-                corrupted_count = 0
-                total_checked = 0
-                for value, stored_checksum in cursor.fetchall():
-                    total_checked += 1
-                    if self.calculate_hash(value) != stored_checksum:
-                        corrupted_count += 1
-                stats['corrupted_records'] = corrupted_count
-                stats['total_checked'] = total_checked
-                stats['integrity_percentage'] = ((total_checked - corrupted_count) / total_checked * 100) if total_checked > 0 else 100
-                
-                # Verificar integridad de la estructura
-                cursor.execute("PRAGMA integrity_check")
-                integrity_check = cursor.fetchone()[0]
-                stats['structural_integrity'] = integrity_check == "ok"
-                
-                # Obtener estadísticas de eventos del sistema
-                cursor.execute("SELECT COUNT(*) FROM system_events")
-                stats['total_events'] = cursor.fetchone()[0]
-                
-                cursor.execute("SELECT COUNT(*) FROM system_events WHERE event_type = 'ERROR'")
-                stats['error_events'] = cursor.fetchone()[0]
-                
+            cursor = self.cursor_r
+            max_id = cursor.execute("SELECT MAX(id) FROM test_data").fetchone()[0] or 0
+            workers = os.cpu_count() or 1
+            
+            if max_id >= self._PARALLEL_VERIFY_MIN_ROWS and workers > 1:
+                # Repartir la verificación de checksums por rangos de id entre procesos;
+                # el modo WAL permite varios lectores simultáneos
+                step = -(-max_id // workers)
+                ranges = [(self.db_path, first, min(first + step - 1, max_id))
+                          for first in range(1, max_id + 1, step)]
+                # Los procesos se crean con spawn: este proceso ya tiene hilos y
+                # conexiones SQLite abiertas, que no pueden heredarse con fork
+                with multiprocessing.get_context("spawn").Pool(len(ranges)) as pool:
+                    results = pool.starmap_async(verify_id_range, ranges)
+                    cursor.execute(f"SELECT {self._DATE_RANGE_COLUMNS} FROM test_data")
+                    first_date, last_date = cursor.fetchone()
+                    results = results.get()
+                total_checked = sum(checked for checked, _ in results)
+                corrupted_count = sum(corrupted for _, corrupted in results)
+            else:
+                # Obtener número de registros, fechas del primer y último registro y
+                # verificar los checksums en un único recorrido de la tabla
+                cursor.execute(f'''
+                    SELECT COUNT(*), {self._DATE_RANGE_COLUMNS},
+                           COALESCE(SUM(calculate_hash(value) IS NOT checksum), 0)
+                    FROM test_data
+                ''')
+                total_checked, first_date, last_date, corrupted_count = cursor.fetchone()
+            stats['total_records'] = total_checked
+            stats['first_record'] = self.format_timestamp(first_date)
+            stats['last_record'] = self.format_timestamp(last_date)
+            
+            # Obtener tamaño de la base de datos
+            stats['db_size'] = os.path.getsize(self.db_path)
+            
+            stats['corrupted_records'] = corrupted_count
+            stats['total_checked'] = total_checked
+            stats['integrity_percentage'] = ((total_checked - corrupted_count) / total_checked * 100) if total_checked > 0 else 100
+            
+            # Verificar integridad de la estructura
+            cursor.execute("PRAGMA integrity_check")
+            integrity_check = cursor.fetchone()[0]
+            stats['structural_integrity'] = integrity_check == "ok"
+            
+            # Obtener estadísticas de eventos del sistema
+            cursor.execute("SELECT COUNT(*), COALESCE(SUM(event_type = 'ERROR'), 0) FROM system_events")
+            stats['total_events'], stats['error_events'] = cursor.fetchone()
+            
         except sqlite3.Error as e:
             logging.error(f"Error al obtener estadísticas: {e}")
             stats['error'] = str(e)
@@ -159,35 +507,48 @@ class SQLiteStressTest:
         start_time = time.time()
         last_progress_time = start_time
         
+        # Referencias locales para evitar búsquedas de atributos en cada iteración
+        now = time.time
+        monotonic = time.monotonic
+        sleep = time.sleep
+        payloads = iter(())
+        pending = self._pending
+        append = pending.append
+        flush = self.flush_pending
+        batch_size = self.batch_size
+        max_batch_age = self.max_batch_age
+        progress_interval = self.progress_interval
+        pause_time = self.pause_time
+        next_tick = monotonic()
+        
         try:
             while True:  # Bucle infinito
                 try:
-                    # Generar datos aleatorios
-                    data = ''.join(random.choices('abcdefghijklmnopqrstuvwxyz', k=1000))
-                    timestamp = datetime.now().isoformat()
-                    
-                    # Calcular checksum MD5
-                    checksum = self.calculate_hash(data)
+                    # Tomar el siguiente dato aleatorio con su checksum XXH3, generándolos
+                    # por bloques del tamaño del lote
+                    payload = next(payloads, None)
+                    if payload is None:
+                        payloads = iter(generate_payloads(batch_size))
+                        payload = next(payloads)
+                    data, checksum = payload
+                    timestamp = now()
                     
-                    # Escribir datos
-                    with sqlite3.connect(self.db_path) as conn:
-                        cursor = conn.cursor()
-                        cursor.execute(
-                            "INSERT INTO test_data (timestamp, value, checksum) VALUES (?, ?, ?)",
-                            (timestamp, data, checksum)
-                        )
-                        conn.commit()
+                    # Acumular datos y escribirlos por lotes, sin que el registro más
+                    # antiguo espere más de max_batch_age segundos
+                    append((timestamp, data, checksum))
+                    if len(pending) >= batch_size or timestamp - pending[0][0] >= max_batch_age:
+                        flush()
                     
                     # Mostrar progreso según el intervalo configurado
-                    current_time = time.time()
-                    if current_time - last_progress_time >= self.progress_interval:
+                    current_time = now()
+                    if current_time - last_progress_time >= progress_interval:
                         elapsed_time = current_time - start_time
                         records_per_second = i / elapsed_time if elapsed_time > 0 else 0
                         
                         print(f"\rProgreso: {i} registros | "
                               f"Velocidad: {records_per_second:.2f} reg/s | "
                               f"Tiempo transcurrido: {elapsed_time:.1f}s | "
-                              f"Tamaño DB: {os.path.getsize(self.db_path) / 1024 / 1024:.2f} MB", 
+                              f"Tamaño DB: {self.database_size() / 1024 / 1024:.2f} MB", 
                               end='', flush=True)
                         
                         last_progress_time = current_time
@@ -200,8 +561,16 @@ class SQLiteStressTest:
                     
                     i += 1
                     
-                    # Esperar el tiempo especificado antes de la siguiente escritura
-                    time.sleep(self.pause_time)
+                    # Esperar hasta la siguiente escritura. La pausa se hace siempre fuera
+                    # de cualquier transacción y se programa sobre un reloj monotónico para
+                    # mantener la cadencia sin acumular deriva; si la iteración se ha
+                    # retrasado más que la pausa, la programación se reinicia.
+                    next_tick += pause_time
+                    delay = next_tick - monotonic()
+                    if delay < 0:
+                        next_tick -= delay
+                        delay = 0
+                    sleep(delay)
                         
                 except sqlite3.Error as e:
                     print()  # Nueva línea para separar el error del progreso
@@ -210,6 +579,10 @@ class SQLiteStressTest:
         except KeyboardInterrupt:
             print("\n")  # Nueva línea para separar el reporte final del progreso
             logging.info("Prueba interrumpida por el usuario")
+            try:
+                self.flush_pending()
+            except sqlite3.Error as e:
+                logging.error(f"Error al escribir los registros pendientes: {e}")
             stats = self.get_database_stats()
             
             print("\n=== Reporte Final de la Base de Datos ===")
@@ -245,14 +618,20 @@ class SQLiteStressTest:
     def verify_data(self):
         """!
         @brief Verifica la integridad de los datos almacenados
+        @details Comprueba 10 registros elegidos al azar por su id, evitando ordenar
+                 toda la tabla.
         """
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT value, checksum FROM test_data ORDER BY RANDOM() LIMIT 10")
-            for value, stored_checksum in cursor.fetchall():
-                calculated_checksum = self.calculate_hash(value)
-                if calculated_checksum != stored_checksum:
-                    logging.error(f"¡Error de integridad detectado! Esperado: {stored_checksum}, Calculado: {calculated_checksum}")
+        max_id = self.cursor_r.execute("SELECT MAX(id) FROM test_data").fetchone()[0]
+        if max_id is None:
+            return
+        ids = random.sample(range(1, max_id + 1), min(10, max_id))
+        placeholders = ",".join("?" * len(ids))
+        self.cursor_r.execute(f"SELECT value, checksum FROM test_data WHERE id IN ({placeholders})", ids)
+        for value, stored_checksum in self.cursor_r.fetchall():
+            calculated_checksum = self.calculate_hash(value)
+            if calculated_checksum != stored_checksum:
+                logging.error(f"¡Error de integridad detectado! Esperado: {format_digest(stored_checksum)}, "
+                              f"Calculado: {format_digest(calculated_checksum)}")
 
 if __name__ == "__main__":
     """!
@@ -263,8 +642,11 @@ if __name__ == "__main__":
                       help='Tiempo de pausa entre operaciones en segundos (default: 10)')
     parser.add_argument('--progress-interval', type=float, default=10,
                       help='Intervalo de actualización del progreso en segundos (default: 10)')
+    parser.add_argument('--batch-size', type=int, default=100,
+                      help='Número de registros escritos por transacción (default: 100)')
     args = parser.parse_args()
     
-    test = SQLiteStressTest('.', pause_time=args.pause, progress_interval=args.progress_interval)
+    test = SQLiteStressTest('.', pause_time=args.pause, progress_interval=args.progress_interval,
+                            batch_size=args.batch_size)
     test.run_stress_test()
     
\ No newline at end of file
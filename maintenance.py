@@ -2,177 +2,447 @@ import sqlite3
 import os
 import shutil
 import logging
+import atexit
+import time
+import queue
+import threading
+import functools
 from datetime import datetime
-import psutil
 
-def verificar_integridad(db_path='stress_test.db'):
+# Ruta de la base de datos usada por defecto en todas las funciones
+_DB_PATH = 'stress_test.db'
+
+# Conexiones abiertas por ruta de base de datos, reutilizadas entre llamadas
+_CONEXIONES = {}
+
+# Sentencia de inserción de eventos; se mantiene constante para que sqlite3
+# reutilice la sentencia preparada de su caché. La marca de tiempo la genera
+# SQLite en hora local con el mismo formato ISO que los eventos existentes.
+_INSERTAR_EVENTO = (
+    "INSERT INTO system_events (timestamp, event_type, details) "
+    "VALUES (strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime'), ?, ?)"
+)
+
+# Intentos del mantenimiento de power on mientras la base de datos esté bloqueada
+_INTENTOS_BLOQUEO = 5
+
+# Máximo de parámetros por sentencia (límite clásico de SQLite anterior a la 3.32)
+MAX_PARAMETROS_SQL = 999
+
+# Columnas de system_events que se rellenan al insertar un evento y máximo de
+# eventos por sentencia INSERT múltiple
+_COLUMNAS_EVENTOS = ('timestamp', 'event_type', 'details')
+_MAX_EVENTOS_POR_INSERT = MAX_PARAMETROS_SQL // len(_COLUMNAS_EVENTOS)
+
+# Errores pendientes de escribir en system_events como tuplas
+# (db_path, timestamp, details).
+# Un hilo en segundo plano los escribe por lotes de hasta _LOTE_ERRORES.
+_COLA_ERRORES = queue.Queue(maxsize=1024)
+_LOTE_ERRORES = 64
+_hilo_errores = None
+_hilo_errores_lock = threading.Lock()
+
+def _conectar(db_path):
+    """!
+    @brief Abre una conexión con la configuración de rendimiento común
+    @details La conexión trabaja en modo autocommit, con el journal en modo WAL,
+             sincronización NORMAL, caché de 16 MB, tablas temporales en memoria y
+             el fichero mapeado en memoria (hasta 256 MB). El WAL se recorta a 64 MB
+             tras cada checkpoint. El tamaño de página y el autovacuum incremental solo
+             tienen efecto si la base de datos aún está vacía.
+    @param db_path Ruta de la base de datos
+    @return Conexión sqlite3 configurada
+    """
+    conn = sqlite3.connect(db_path, isolation_level=None, cached_statements=256)
+    conn.execute("PRAGMA page_size=8192")
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA mmap_size=268435456")
+    conn.execute("PRAGMA cache_size=-16000")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA busy_timeout=5000")
+    conn.execute("PRAGMA journal_size_limit=67108864")
+    return conn
+
+def _obtener_conexion(db_path):
+    """!
+    @brief Devuelve la conexión persistente de una base de datos, abriéndola si es necesario
+    @param db_path Ruta de la base de datos
+    @return Conexión sqlite3 configurada
+    """
+    conn = _CONEXIONES.get(db_path)
+    if conn is None:
+        conn = _conectar(db_path)
+        _asegurar_esquema(conn)
+        _CONEXIONES[db_path] = conn
+    return conn
+
+def _asegurar_esquema(conn):
+    """!
+    @brief Crea las tablas e índices que usa el mantenimiento si aún no existen
+    @param conn Conexión a la base de datos
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS system_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp DATETIME,
+            event_type TEXT,
+            details TEXT
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_events_type_ts ON system_events(event_type, timestamp)")
+
+def _insertar_evento(conn, event_type, details):
+    """!
+    @brief Inserta un evento del sistema en su propia transacción
+    @details La transacción se abre con BEGIN IMMEDIATE para obtener el bloqueo de
+             escritura desde el principio.
+    @param conn Conexión a la base de datos
+    @param event_type Tipo de evento (POWER_ON, ERROR, etc.)
+    @param details Detalles del evento
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(_INSERTAR_EVENTO, (event_type, details))
+        conn.execute("COMMIT")
+    except sqlite3.Error:
+        conn.execute("ROLLBACK")
+        raise
+
+def _cerrar_conexiones():
+    """!
+    @brief Cierra todas las conexiones persistentes
+    """
+    while _CONEXIONES:
+        _, conn = _CONEXIONES.popitem()
+        try:
+            conn.close()
+        except sqlite3.Error as e:
+            logging.error("Error al cerrar la conexión: %s", e)
+
+atexit.register(_cerrar_conexiones)
+
+@functools.lru_cache(maxsize=None)
+def sentencia_insert_multiple(table, columns, rows):
+    """!
+    @brief Construye una sentencia INSERT de varias filas
+    @details Para no superar MAX_PARAMETROS_SQL, rows no debe pasar de
+             MAX_PARAMETROS_SQL // len(columns).
+    @param table Nombre de la tabla
+    @param columns Tupla con los nombres de las columnas
+    @param rows Número de filas de la sentencia
+    @return str Sentencia con un grupo de parámetros por fila
+    """
+    group = "(" + ", ".join("?" * len(columns)) + ")"
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES " + ", ".join([group] * rows)
+
+def _insertar_eventos(conn, events):
+    """!
+    @brief Inserta varios eventos en una única transacción
+    @details Cada bloque de hasta _MAX_EVENTOS_POR_INSERT eventos se escribe con una
+             sola sentencia INSERT de varias filas, que SQLite prepara y ejecuta una
+             vez en lugar de una vez por evento.
+    @param conn Conexión a la base de datos
+    @param events Lista de tuplas (timestamp, event_type, details)
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for start in range(0, len(events), _MAX_EVENTOS_POR_INSERT):
+            chunk = events[start:start + _MAX_EVENTOS_POR_INSERT]
+            params = [value for event in chunk for value in event]
+            conn.execute(sentencia_insert_multiple('system_events', _COLUMNAS_EVENTOS, len(chunk)), params)
+        conn.execute("COMMIT")
+    except sqlite3.Error:
+        conn.execute("ROLLBACK")
+        raise
+
+def _vaciar_cola_errores():
+    """!
+    @brief Bucle del hilo que escribe por lotes los errores encolados
+    @details El hilo usa sus propias conexiones y termina al recibir None.
+    """
+    conexiones = {}
+    terminar = False
+    while not terminar:
+        items = [_COLA_ERRORES.get()]
+        while len(items) < _LOTE_ERRORES:
+            try:
+                items.append(_COLA_ERRORES.get_nowait())
+            except queue.Empty:
+                break
+        if None in items:
+            terminar = True
+            items = [item for item in items if item is not None]
+        
+        lotes = {}
+        for db_path, timestamp, details in items:
+            lotes.setdefault(db_path, []).append((timestamp, 'ERROR', details))
+        for db_path, events in lotes.items():
+            try:
+                conn = conexiones.get(db_path)
+                if conn is None:
+                    conn = conexiones[db_path] = _conectar(db_path)
+                    _asegurar_esquema(conn)
+                _insertar_eventos(conn, events)
+                logging.info("%s errores registrados en la base de datos", len(events))
+            except sqlite3.Error as e:
+                logging.error("Error al registrar %s errores en la base de datos: %s", len(events), e)
+    
+    for conn in conexiones.values():
+        conn.close()
+
+def _iniciar_hilo_errores():
+    """!
+    @brief Arranca el hilo de escritura de errores si aún no está en marcha
+    """
+    global _hilo_errores
+    with _hilo_errores_lock:
+        if _hilo_errores is None:
+            _hilo_errores = threading.Thread(target=_vaciar_cola_errores, name="registro-errores", daemon=True)
+            _hilo_errores.start()
+            atexit.register(_detener_hilo_errores)
+
+def _detener_hilo_errores():
+    """!
+    @brief Escribe los errores pendientes y detiene el hilo de escritura
+    """
+    global _hilo_errores
+    with _hilo_errores_lock:
+        if _hilo_errores is None:
+            return
+        _COLA_ERRORES.put(None)
+        _hilo_errores.join()
+        _hilo_errores = None
+
+def verificar_integridad(db_path=_DB_PATH, deep=False):
     """!
     @brief Verifica la integridad de la base de datos
+    @details Por defecto usa PRAGMA quick_check, que detecta la corrupción estructural
+             sin verificar el contenido de los índices.
     @param db_path Ruta de la base de datos
+    @param deep True para ejecutar el PRAGMA integrity_check completo
     @return bool True si la integridad es correcta
+    @exception sqlite3.Error Si no se puede ejecutar la verificación
     """
-    try:
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
-            # Verificar integridad de la estructura
-            cursor.execute("PRAGMA integrity_check")
-            result = cursor.fetchone()[0]
-            if result != "ok":
-                logging.error(f"Error de integridad en la base de datos: {result}")
-                return False
-            return True
-    except sqlite3.Error as e:
-        logging.error(f"Error al verificar integridad: {e}")
+    conn = _obtener_conexion(db_path)
+    cursor = conn.cursor()
+    # Verificar integridad de la estructura
+    cursor.execute("PRAGMA integrity_check" if deep else "PRAGMA quick_check")
+    result = cursor.fetchone()[0]
+    if result != "ok":
+        logging.error("Error de integridad en la base de datos: %s", result)
         return False
+    return True
 
-def realizar_checkpoint(db_path='stress_test.db'):
+def realizar_checkpoint(db_path=_DB_PATH, mode='RESTART'):
     """!
     @brief Realiza un checkpoint del WAL (Write-Ahead Logging)
+    @details Por defecto usa el modo RESTART, que reinicia el WAL desde el principio
+             sin truncar el archivo, evitando que el sistema de ficheros tenga que
+             volver a asignar sus bloques en la siguiente escritura.
+    @param db_path Ruta de la base de datos
+    @param mode Modo del checkpoint (PASSIVE, FULL, RESTART o TRUNCATE)
+    @exception sqlite3.Error Si el checkpoint falla
+    """
+    conn = _obtener_conexion(db_path)
+    cursor = conn.cursor()
+    cursor.execute(f"PRAGMA wal_checkpoint({mode})")
+    logging.info("Checkpoint WAL realizado correctamente")
+
+def realizar_checkpoint_passive(db_path=_DB_PATH):
+    """!
+    @brief Realiza un checkpoint pasivo del WAL
+    @details Vuelca todo lo posible sin esperar a los lectores ni a los escritores
+             activos.
     @param db_path Ruta de la base de datos
     """
     try:
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
-            logging.info("Checkpoint WAL realizado correctamente")
+        conn = _obtener_conexion(db_path)
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        logging.info("Checkpoint WAL pasivo realizado correctamente")
     except sqlite3.Error as e:
-        logging.error(f"Error al realizar checkpoint: {e}")
+        logging.error("Error al realizar checkpoint pasivo: %s", e)
 
-def limpiar_archivos_temporales():
+def limpiar_archivos_temporales(db_path=_DB_PATH):
     """!
-    @brief Limpia archivos temporales relacionados con la base de datos
+    @brief Limpia los archivos temporales relacionados con la base de datos
+    @details Los archivos -wal y -shm no se borran a mano: el WAL puede contener
+             transacciones confirmadas que aún no están en la base de datos. Un
+             checkpoint TRUNCATE vuelca el WAL y lo deja vacío, y SQLite elimina los
+             archivos al cerrarse la última conexión.
+    @param db_path Ruta de la base de datos
     """
-    temp_files = [
-        'stress_test.db-shm',  # Archivo de memoria compartida
-        'stress_test.db-wal',  # Archivo WAL
-        'stress_test.db-journal'  # Archivo de journal
-    ]
-    
-    for file in temp_files:
-        if os.path.exists(file):
-            try:
-                os.remove(file)
-                logging.info(f"Archivo temporal eliminado: {file}")
-            except Exception as e:
-                logging.error(f"Error al eliminar archivo temporal {file}: {e}")
+    try:
+        conn = _obtener_conexion(db_path)
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        logging.info("Archivos temporales del WAL vaciados correctamente")
+    except sqlite3.Error as e:
+        logging.error("Error al limpiar archivos temporales: %s", e)
 
-def verificar_espacio(required_space_mb=100):
+def verificar_espacio(required_space_mb=100, db_path=_DB_PATH):
     """!
-    @brief Verifica el espacio disponible en disco
+    @brief Verifica el espacio disponible en el disco donde está la base de datos
     @param required_space_mb Espacio requerido en MB
+    @param db_path Ruta de la base de datos
     @return bool True si hay suficiente espacio
     """
     try:
-        disk = psutil.disk_usage('/')
+        # shutil.disk_usage consulta directamente el sistema de ficheros
+        # (statvfs en POSIX, GetDiskFreeSpaceEx en Windows)
+        disk = shutil.disk_usage(os.path.dirname(os.path.abspath(db_path)))
         free_space_mb = disk.free / (1024 * 1024)
         
         if free_space_mb < required_space_mb:
-            logging.error(f"Espacio insuficiente. Disponible: {free_space_mb:.2f}MB, Requerido: {required_space_mb}MB")
+            logging.error("Espacio insuficiente. Disponible: %.2fMB, Requerido: %sMB", free_space_mb, required_space_mb)
             return False
             
-        logging.info(f"Espacio disponible: {free_space_mb:.2f}MB")
+        logging.info("Espacio disponible: %.2fMB", free_space_mb)
         return True
     except Exception as e:
-        logging.error(f"Error al verificar espacio: {e}")
+        logging.error("Error al verificar espacio: %s", e)
         return False
 
-def registrar_evento_inicio():
+def registrar_evento_inicio(db_path=_DB_PATH):
     """!
     @brief Registra el evento de inicio en el log
+    @param db_path Ruta de la base de datos
+    @exception sqlite3.Error Si no se puede escribir el evento
+    """
+    conn = _obtener_conexion(db_path)
+    _insertar_evento(conn, 'POWER_ON', 'Inicio del sistema')
+    logging.info("Evento de inicio registrado correctamente")
+
+def registrar_eventos_bulk(events, db_path=_DB_PATH):
+    """!
+    @brief Registra varios eventos en la base de datos de una sola vez
+    @param events Lista de tuplas (timestamp, event_type, details); el timestamp
+                  usa el formato ISO local de los demás eventos
+    @param db_path Ruta de la base de datos
     """
     try:
-        with sqlite3.connect('stress_test.db') as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS system_events (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp DATETIME,
-                    event_type TEXT,
-                    details TEXT
-                )
-            ''')
-            
-            cursor.execute(
-                "INSERT INTO system_events (timestamp, event_type, details) VALUES (?, ?, ?)",
-                (datetime.now().isoformat(), 'POWER_ON', 'Inicio del sistema')
-            )
-            conn.commit()
-            logging.info("Evento de inicio registrado correctamente")
+        conn = _obtener_conexion(db_path)
+        _insertar_eventos(conn, events)
+        logging.info("%s eventos registrados correctamente", len(events))
     except sqlite3.Error as e:
-        logging.error(f"Error al registrar evento de inicio: {e}")
+        logging.error("Error al registrar eventos: %s", e)
 
-def registrar_error(error):
+def registrar_error(error, db_path=_DB_PATH):
     """!
     @brief Registra un error en la base de datos
+    @details El error se encola y lo escribe el hilo de registro de errores en el
+             siguiente lote. Si la cola está llena se escribe directamente; si esa
+             escritura también falla, el error solo queda en el log. No propaga
+             excepciones, ya que se llama desde los manejadores de errores.
     @param error Objeto de excepción
+    @param db_path Ruta de la base de datos
     """
+    details = str(error)
+    _iniciar_hilo_errores()
     try:
-        with sqlite3.connect('stress_test.db') as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO system_events (timestamp, event_type, details) VALUES (?, ?, ?)",
-                (datetime.now().isoformat(), 'ERROR', str(error))
-            )
-            conn.commit()
-            logging.error(f"Error registrado en la base de datos: {error}")
-    except sqlite3.Error as e:
-        logging.error(f"Error al registrar error en la base de datos: {e}")
+        timestamp = datetime.now().isoformat(timespec='milliseconds')
+        _COLA_ERRORES.put_nowait((db_path, timestamp, details))
+    except queue.Full:
+        try:
+            conn = _obtener_conexion(db_path)
+            _insertar_evento(conn, 'ERROR', details)
+            logging.error("Error registrado en la base de datos: %s", details)
+        except sqlite3.Error as e:
+            logging.error("Error al registrar error en la base de datos (%s): %s", details, e)
+    else:
+        logging.error("Error encolado para registrarlo en la base de datos: %s", details)
 
-def intentar_recuperacion():
+def intentar_recuperacion(db_path=_DB_PATH):
     """!
     @brief Intenta recuperar el sistema de un error
+    @details No se vacía el WAL con un checkpoint TRUNCATE, que esperaría a los lectores
+             activos; el checkpoint pasivo vuelca lo posible sin bloquear.
+    @param db_path Ruta de la base de datos
+    @return bool True si la base de datos supera de nuevo la verificación
     """
     try:
-        # 1. Intentar realizar un checkpoint forzado
-        realizar_checkpoint()
+        # 1. Intentar realizar un checkpoint sin bloquear a otras conexiones
+        realizar_checkpoint_passive(db_path)
         
-        # 2. Limpiar archivos temporales
-        limpiar_archivos_temporales()
-        
-        # 3. Verificar integridad nuevamente
-        if verificar_integridad():
+        # 2. Verificar integridad nuevamente
+        if verificar_integridad(db_path):
             logging.info("Recuperación exitosa")
             return True
         else:
             logging.error("No se pudo recuperar el sistema")
             return False
     except Exception as e:
-        logging.error(f"Error durante la recuperación: {e}")
+        logging.error("Error durante la recuperación: %s", e)
         return False
 
-def realizar_mantenimiento_power_on():
+def _es_bloqueo(error):
+    """!
+    @brief Indica si un error se debe a que otra conexión tiene la base de datos ocupada
+    @param error Excepción capturada
+    @return bool True si el código primario es SQLITE_BUSY o SQLITE_LOCKED
+    """
+    code = getattr(error, 'sqlite_errorcode', None)
+    return code is not None and code & 0xff in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+
+def realizar_mantenimiento_power_on(db_path=_DB_PATH):
     """!
     @brief Realiza el mantenimiento del sistema al iniciar
+    @details Todos los pasos usan la conexión persistente de la base de datos, también
+             los que se delegan en las funciones auxiliares, y el evento de inicio se
+             escribe en una única transacción. Los errores de SQLite y del sistema
+             de ficheros se tratan aquí una sola vez; las funciones auxiliares los
+             propagan sin capturarlos. Si la base de datos está ocupada o bloqueada por
+             otra conexión se reintenta hasta _INTENTOS_BLOQUEO veces antes de intentar
+             la recuperación.
+    @param db_path Ruta de la base de datos
     @return bool True si el mantenimiento fue exitoso
     """
-    try:
-        logging.info("Iniciando mantenimiento de power on...")
-        
-        # 1. Verificar integridad de la base de datos
-        if not verificar_integridad():
-            raise Exception("Error de integridad en la base de datos")
-        
-        # 2. Realizar checkpoint del WAL
-        realizar_checkpoint()
-        
-        # 3. Limpiar archivos temporales
-        limpiar_archivos_temporales()
-        
-        # 4. Verificar espacio en disco
-        if not verificar_espacio():
-            raise Exception("Espacio insuficiente en disco")
-        
-        # 5. Registrar evento de inicio
-        registrar_evento_inicio()
-        
-        logging.info("Mantenimiento de power on completado exitosamente")
-        return True
-        
-    except Exception as e:
-        registrar_error(e)
-        if intentar_recuperacion():
-            logging.info("Sistema recuperado después del error")
+    for attempt in range(_INTENTOS_BLOQUEO):
+        try:
+            logging.info("Iniciando mantenimiento de power on...")
+            conn = _obtener_conexion(db_path)
+            
+            # 1. Verificar integridad de la base de datos
+            if not verificar_integridad(db_path):
+                raise sqlite3.DatabaseError("Error de integridad en la base de datos")
+            
+            # 2. Realizar checkpoint del WAL, que lo reinicia para las siguientes escrituras
+            realizar_checkpoint(db_path, 'RESTART')
+            
+            # Recuperar hasta 1000 páginas libres sin bloquear con un VACUUM completo.
+            # executescript ejecuta el PRAGMA hasta el final; execute solo daría un paso.
+            conn.executescript("PRAGMA incremental_vacuum(1000)")
+            
+            # 3. Verificar espacio en disco
+            if not verificar_espacio(db_path=db_path):
+                raise OSError("Espacio insuficiente en disco")
+            
+            # 4. Registrar evento de inicio
+            registrar_evento_inicio(db_path)
+            
+            # 5. Actualizar las estadísticas del planificador de consultas en todas las
+            #    tablas (0x10000 | 0x02). analysis_limit, junto con el bit 0x10 en las
+            #    versiones de SQLite que lo admiten, limita ANALYZE a unas 400 filas por
+            #    índice para que no recorra tablas completas.
+            conn.execute("PRAGMA analysis_limit=400")
+            conn.execute("PRAGMA optimize=0x10012")
+            
+            logging.info("Mantenimiento de power on completado exitosamente")
             return True
-        else:
-            logging.error("No se pudo completar el mantenimiento de power on")
-            return False 
\ No newline at end of file
+            
+        except (sqlite3.Error, OSError) as e:
+            # Un bloqueo de otra conexión es transitorio: se reintenta con espera
+            # exponencial antes de pasar a la recuperación
+            if _es_bloqueo(e) and attempt < _INTENTOS_BLOQUEO - 1:
+                logging.warning("Base de datos bloqueada (intento %s/%s): %s", attempt + 1, _INTENTOS_BLOQUEO, e)
+                time.sleep(0.05 * 2 ** attempt)
+                continue
+            
+            registrar_error(e, db_path)
+            if intentar_recuperacion(db_path):
+                logging.info("Sistema recuperado después del error")
+                return True
+            else:
+                logging.error("No se pudo completar el mantenimiento de power on")
+                return False